@@ -1,6 +1,8 @@
 """CLI Tool for generating Ansible collection documentation from module spec"""
 
 import argparse
+import ast
+import functools
 import importlib
 import importlib.machinery
 import importlib.util
@@ -8,17 +10,42 @@ import json
 import os
 import pathlib
 import sys
+import tempfile
 from types import ModuleType
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
 
-import jinja2
 import yaml
-from redbaron import RedBaron
 
 from ansible_specdoc.objects import SpecDocMeta
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+# orjson is an optional, faster backend for JSON output
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SPECDOC_META_VAR = "SPECDOC_META"
 
+INJECTED_FIELDS = ("DOCUMENTATION", "RETURN", "EXAMPLES")
+
+
+class NoAliasDumper(SafeDumper):  # pylint: disable=too-many-ancestors
+    """
+    YAML dumper that never emits anchors or aliases.
+
+    Generated doc dicts share list values with the spec,
+    which may themselves be shared between fields.
+    """
+
+    def ignore_aliases(self, data):
+        return True
+
 
 class SpecDocModule:
     """Class for processing Ansible modules"""
@@ -47,7 +74,13 @@ class SpecDocModule:
             self._module_name, self._module_file
         )
         self._module = importlib.util.module_from_spec(self._module_spec)
-        self._module_spec.loader.exec_module(self._module)
+
+        # Execute the source we've already read rather than having the
+        # loader read the file from disk again
+        exec(
+            compile(self._module_str, self._module_file, "exec"),
+            self._module.__dict__,
+        )
 
         if not hasattr(self._module, SPECDOC_META_VAR):
             raise Exception(
@@ -82,122 +115,222 @@ class SpecDocModule:
 
     @staticmethod
     def __format_json(data):
-        print(json.loads(data))
+        if isinstance(data, str):
+            data = json.loads(data)
+
         return json.dumps(
             data, sort_keys=True, indent=4, separators=(",", ": ")
         )
 
-    def __generate_doc_dict(self):
+    def generate_dict(self) -> Dict[str, Any]:
         """Generates a dict for use in documentation"""
-        result = self._metadata.doc_dict
-        result["module"] = self._module_name
-        return result
+        return {**self._metadata.doc_dict, "module": self._module_name}
 
-    def __generate_ansible_doc_dicts(self):
-        documentation, returns, examples = self._metadata.ansible_doc
-        documentation["module"] = self._module_name
+    def __generate_ansible_doc_dicts(self, raw_examples: bool = False):
+        documentation, returns, examples = self._metadata.get_ansible_doc(
+            raw_examples=raw_examples
+        )
+        documentation = {**documentation, "module": self._module_name}
         return documentation, returns, examples
 
-    def generate_yaml(self) -> str:
-        """Generates a YAML documentation string"""
-        return yaml.dump(self.__generate_doc_dict())
+    def generate_yaml(self, stream: Optional[TextIO] = None) -> Optional[str]:
+        """
+        Generates a YAML documentation string,
+        or writes it to the given stream if one is specified.
+        """
+        return yaml.dump(self.generate_dict(), stream, Dumper=NoAliasDumper)
 
     def generate_ansible_doc_yaml(self) -> Tuple[str, str, str]:
         """Generates YAML documentation strings for all Ansible documentation fields."""
-        documentation, returns, examples = self.__generate_ansible_doc_dicts()
-
-        return (
-            yaml.dump(documentation),
-            yaml.dump(returns),
-            yaml.dump(examples, sort_keys=False),
+        documentation, returns, examples = self.__generate_ansible_doc_dicts(
+            raw_examples=True
         )
 
-    def generate_json(self) -> str:
-        """Generates a JSON documentation string"""
-        return json.dumps(self.__generate_doc_dict())
+        # The examples are already YAML, so they're written out as-is
+        # rather than being parsed and re-serialized.
+        # They are still composed, which skips building Python objects,
+        # so that invalid YAML is rejected.
+        yaml.compose(examples, Loader=SafeLoader)
 
-    def generate_jinja2(self, tmpl_str: str) -> str:
-        """Generates a text output from the given Jinja2 template"""
-        env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True)
+        examples = examples.strip("\n")
+        if examples:
+            examples += "\n"
 
-        template = env.from_string(tmpl_str)
-        env.filters["format_json"] = self.__format_json
+        return (
+            yaml.dump(documentation, Dumper=NoAliasDumper),
+            yaml.dump(returns, Dumper=NoAliasDumper),
+            examples,
+        )
 
-        return template.render(self.__generate_doc_dict())
+    def generate_json(self, stream: Optional[TextIO] = None) -> Optional[str]:
+        """
+        Generates a JSON documentation string,
+        or writes it to the given stream if one is specified.
+        """
+        doc_dict = self.generate_dict()
+
+        if orjson is not None:
+            try:
+                result = orjson.dumps(
+                    doc_dict, option=orjson.OPT_NON_STR_KEYS
+                ).decode()
+            except orjson.JSONEncodeError:
+                # orjson rejects some values the stdlib encoder accepts,
+                # e.g. integers outside of the 64-bit range
+                pass
+            else:
+                if stream is not None:
+                    stream.write(result)
+                    return None
+
+                return result
+
+        # Match orjson's compact, non-escaped output.
+        # Unlike orjson, NaN and infinite floats are written as
+        # NaN/Infinity rather than null.
+        if stream is not None:
+            json.dump(
+                doc_dict, stream, separators=(",", ":"), ensure_ascii=False
+            )
+            return None
 
+        return json.dumps(doc_dict, separators=(",", ":"), ensure_ascii=False)
 
-class CLI:
-    """Class for handling all CLI functionality of ansible-specdoc"""
+    @staticmethod
+    def jinja2_environment(**kwargs):
+        """
+        Returns a new Jinja2 environment configured for documentation templates.
+        Any keyword arguments (e.g. loader) are passed to jinja2.Environment.
+        """
 
-    def __init__(self):
-        self._parser = argparse.ArgumentParser(
-            description="Generate Ansible Module documentation from spec."
-        )
+        # Jinja2 is only needed for templated output, so avoid importing it
+        # on every run of the CLI.
+        import jinja2  # pylint: disable=import-outside-toplevel
 
-        self._parser.add_argument(
-            "-s",
-            "--stdin",
-            help="Read the module from stdin.",
-            action="store_true",
-        )
-        self._parser.add_argument(
-            "-n",
-            "--module-name",
-            type=str,
-            help="The name of the module (required for stdin)",
-        )
+        env = jinja2.Environment(trim_blocks=True, lstrip_blocks=True, **kwargs)
+        env.filters["format_json"] = SpecDocModule.__format_json
 
-        self._parser.add_argument(
-            "-i",
-            "--input_file",
-            type=str,
-            help="The module to generate documentation from.",
-        )
+        return env
 
-        self._parser.add_argument(
-            "-o",
-            "--output_file",
-            type=str,
-            help="The file to output the documentation to.",
-        )
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def __jinja2_environment():
+        """Returns the Jinja2 environment shared by all template strings"""
+        return SpecDocModule.jinja2_environment()
 
-        self._parser.add_argument(
-            "-f",
-            "--output_format",
-            type=str,
-            choices=["yaml", "json", "jinja2"],
-            help="The output format of the documentation.",
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def __compile_jinja2(tmpl_str: str):
+        """Compiles the given Jinja2 template, reusing previous results"""
+        return SpecDocModule.__jinja2_environment().from_string(tmpl_str)
+
+    def generate_jinja2(
+        self, tmpl_str: str, stream: Optional[TextIO] = None
+    ) -> Optional[str]:
+        """
+        Generates a text output from the given Jinja2 template,
+        or writes it to the given stream if one is specified.
+        """
+        return self.generate_jinja2_from_template(
+            self.__compile_jinja2(tmpl_str), stream
         )
 
-        self._parser.add_argument(
-            "-j",
-            "--inject",
-            help="Inject the output documentation into the `DOCUMENTATION`, "
-            "`RETURN`, and `EXAMPLES` fields of input module.",
-            action="store_true",
-        )
+    def generate_jinja2_from_template(
+        self, template, stream: Optional[TextIO] = None
+    ) -> Optional[str]:
+        """
+        Generates a text output from an already compiled Jinja2 template,
+        or writes it to the given stream if one is specified.
+
+        The template should be loaded from an environment returned by
+        jinja2_environment so that it supports the same filters.
+        """
+        if stream is not None:
+            template.stream(self.generate_dict()).dump(stream)
+            return None
+
+        return template.render(self.generate_dict())
+
+
+@functools.lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser shared by all CLI instances"""
+
+    parser = argparse.ArgumentParser(
+        description="Generate Ansible Module documentation from spec."
+    )
+
+    parser.add_argument(
+        "-s",
+        "--stdin",
+        help="Read the module from stdin.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-n",
+        "--module-name",
+        type=str,
+        help="The name of the module (required for stdin)",
+    )
+
+    parser.add_argument(
+        "-i",
+        "--input_file",
+        type=str,
+        help="The module to generate documentation from.",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        help="The file to output the documentation to.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--output_format",
+        type=str,
+        choices=["yaml", "json", "jinja2"],
+        help="The output format of the documentation.",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--inject",
+        help="Inject the output documentation into the `DOCUMENTATION`, "
+        "`RETURN`, and `EXAMPLES` fields of input module.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--template_file",
+        type=str,
+        help="The file to use as the template for templated formats.",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--clear_injected_fields",
+        help="Clears the DOCUMENTATION, RETURNS, and EXAMPLES fields in"
+        "specified module and sets them to an empty string.",
+        default=False,
+        const=True,
+        nargs="?",
+    )
+
+    return parser
 
-        self._parser.add_argument(
-            "-t",
-            "--template_file",
-            type=str,
-            help="The file to use as the template for templated formats.",
-        )
 
-        self._parser.add_argument(
-            "-c",
-            "--clear_injected_fields",
-            help="Clears the DOCUMENTATION, RETURNS, and EXAMPLES fields in"
-            "specified module and sets them to an empty string.",
-            default=False,
-            const=True,
-            nargs="?",
-        )
+class CLI:
+    """Class for handling all CLI functionality of ansible-specdoc"""
 
-        self._args, _ = self._parser.parse_known_args()
+    def __init__(self, args: Optional[List[str]] = None):
+        self._parser = _build_parser()
+        self._args = self._parser.parse_args(args)
 
         self._mod = SpecDocModule()
-        self._output = ""
 
     def _inject_docs(self, module_content: str) -> str:
         """Injects docs_content into the DOCUMENTATION field of module_content"""
@@ -207,38 +340,83 @@ class CLI:
         else:
             doc, returns, examples = self._mod.generate_ansible_doc_yaml()
 
-        red = RedBaron(module_content)
+        to_inject = {
+            "DOCUMENTATION": doc,
+            "RETURN": returns,
+            "EXAMPLES": examples,
+        }
 
-        to_inject = [
-            ["DOCUMENTATION", doc],
-            ["RETURN", returns],
-            ["EXAMPLES", examples],
-        ]
+        field_values = self._find_injected_fields(module_content)
 
-        for field_info in to_inject:
-            doc_field = red.find("name", value=field_info[0])
-            if doc_field is None or doc_field.parent is None:
+        for name in INJECTED_FIELDS:
+            if name not in field_values:
                 raise Exception(
                     "failed to inject documentation: "
-                    f"an empty {field_info[0]} field must be specified"
+                    f"an empty {name} field must be specified"
                 )
 
-            doc_field.parent.value.value = f'r"""\n{field_info[1]}"""'
+        # AST column offsets are in UTF-8 bytes, so splice the encoded source
+        source = module_content.encode("utf-8")
+        line_offsets = [0]
+        for line in source.splitlines(keepends=True):
+            line_offsets.append(line_offsets[-1] + len(line))
+
+        spans = [
+            (
+                line_offsets[value.lineno - 1] + value.col_offset,
+                line_offsets[value.end_lineno - 1] + value.end_col_offset,
+                name,
+            )
+            for name, value in field_values.items()
+        ]
+
+        # Replace the values back to front so earlier offsets stay valid,
+        # including when multiple fields are assigned on the same line
+        for start, end, name in sorted(spans, reverse=True):
+            source = (
+                source[:start]
+                + f'r"""\n{to_inject[name]}"""'.encode("utf-8")
+                + source[end:]
+            )
 
-        return red.dumps()
+        return source.decode("utf-8")
+
+    @staticmethod
+    def _find_injected_fields(module_content: str) -> Dict[str, ast.expr]:
+        """Finds the first top-level assignment to each injected field"""
+
+        result = {}
+
+        for node in ast.parse(module_content).body:
+            if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+                continue
+
+            target = node.targets[0]
+            if isinstance(target, ast.Name) and target.id in INJECTED_FIELDS:
+                result.setdefault(target.id, node.value)
+
+        return result
 
     @staticmethod
     def _get_ansible_root(base_dir: str) -> Optional[str]:
         """Gets the Ansible root directory for correctly importing Ansible collections"""
 
-        path = pathlib.Path(base_dir)
+        path = pathlib.Path(os.path.abspath(base_dir))
 
-        # Ensure path is a directory
+        # Ensure path is a directory so files in the same directory
+        # share a cache entry
         if not path.is_dir():
             path = path.parent
 
+        return CLI.__find_ansible_root(str(path))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def __find_ansible_root(base_dir: str) -> Optional[str]:
+        path = pathlib.Path(base_dir)
+
         # Check if ansible_collections is contained in base directory
-        if "ansible_collections" in os.listdir(str(path)):
+        if (path / "ansible_collections").is_dir():
             return str(path.absolute())
 
         # Check if base directory is a child of ansible_collections
@@ -274,7 +452,7 @@ class CLI:
                     "Module name must be specified for stdin input"
                 )
 
-            self._mod.load_str("\n".join(sys.stdin), self._args.module_name)
+            self._mod.load_str(sys.stdin.read(), self._args.module_name)
             return
 
         if self._args.input_file is not None:
@@ -289,11 +467,11 @@ class CLI:
             return
 
         if self._args.output_format == "yaml":
-            self._output = self._mod.generate_yaml()
+            self._write_output(self._mod.generate_yaml)
             return
 
         if self._args.output_format == "json":
-            self._output = self._mod.generate_json()
+            self._write_output(self._mod.generate_json)
             return
 
         if self._args.output_format == "jinja2":
@@ -305,7 +483,9 @@ class CLI:
             with open(self._args.template_file) as file:
                 template_str = file.read()
 
-            self._output = self._mod.generate_jinja2(template_str)
+            self._write_output(
+                functools.partial(self._mod.generate_jinja2, template_str)
+            )
             return
 
         self._parser.error("Invalid format specified.")
@@ -325,13 +505,45 @@ class CLI:
             file.write(injected_module)
             file.truncate()
 
-    def _write_output(self):
-        # Write the output
-        if self._args.output_file is not None:
-            with open(self._args.output_file, "w") as file:
-                file.write(self._output)
-        else:
-            sys.stdout.write(self._output)
+    @staticmethod
+    def _get_output_file_mode(output_file: str) -> int:
+        """Gets the permissions to create the output file with"""
+
+        try:
+            return os.stat(output_file).st_mode & 0o777
+        except FileNotFoundError:
+            # Use the same permissions open() would create the file with
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    def _write_output(self, generate: Callable[[TextIO], Any]):
+        output_file = self._args.output_file
+
+        if output_file is None:
+            # Write the output directly to stdout
+            generate(sys.stdout)
+            return
+
+        # Stream the output into a temporary file next to the output file
+        # and only move it into place once generation has succeeded,
+        # so a failed generation doesn't leave the output file truncated.
+        with tempfile.NamedTemporaryFile(
+            "w",
+            dir=os.path.dirname(os.path.abspath(output_file)),
+            delete=False,
+            encoding="utf-8",
+        ) as file:
+            try:
+                generate(file)
+                file.close()
+
+                os.chmod(file.name, self._get_output_file_mode(output_file))
+                os.replace(file.name, output_file)
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
 
     def execute(self):
         """Execute the CLI"""
@@ -340,7 +552,6 @@ class CLI:
         self._load_input_source()
         self._process_docs()
         self._try_inject_original_file()
-        self._write_output()
 
 
 def main():
@@ -4,17 +4,23 @@ This module contains various classes to be used in Ansible modules.
 
 from __future__ import annotations
 
-import copy
 import json
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 class FieldType:
     """
     Enum for Ansible-compatible field types.
+
+    Values are plain (compiler-interned) strings and are emitted as-is.
     """
 
     list = "list"
@@ -31,6 +37,51 @@ class FieldType:
     bits = "bits"
 
 
+# (output key, attribute name) pairs that are only emitted when not None
+DEPRECATION_INFO_ATTRS = (
+    ("alternative", "alternative"),
+    ("removed_in", "removed_in"),
+    ("removed_by_date", "removed_by_date"),
+    ("why", "why"),
+)
+
+SPEC_FIELD_ANSIBLE_DOC_ATTRS = (
+    ("default", "default"),
+    ("choices", "choices"),
+    ("elements", "element_type"),
+    ("aliases", "aliases"),
+    ("version_added", "version_added"),
+)
+
+SPEC_FIELD_ANSIBLE_SPEC_ATTRS = (
+    ("default", "default"),
+    ("choices", "choices"),
+    ("aliases", "aliases"),
+)
+
+SPEC_RETURN_VALUE_ANSIBLE_DOC_ATTRS = (
+    ("elements", "elements"),
+    ("version_added", "version_added"),
+)
+
+SPEC_DOC_META_ANSIBLE_DOC_ATTRS = (("version_added", "version_added"),)
+
+
+def _emit(
+    base: Dict[str, Any], obj: Any, attrs: Tuple[Tuple[str, str], ...]
+) -> Dict[str, Any]:
+    """
+    Adds each of the given object attributes that are not None to base.
+    """
+
+    for key, attr in attrs:
+        value = getattr(obj, attr)
+        if value is not None:
+            base[key] = value
+
+    return base
+
+
 @dataclass
 class DeprecationInfo:
     """
@@ -55,10 +106,10 @@ class DeprecationInfo:
                 "removed_in and removed_by_date are conflicting fields"
             )
 
-        return {k: v for k, v in self.__dict__.items() if v is not None}
+        return _emit({}, self, DEPRECATION_INFO_ATTRS)
 
 
-@dataclass
+@dataclass(slots=True)
 class SpecField:
     """
     A single field to be used in an Ansible module.
@@ -90,29 +141,19 @@ class SpecField:
         Returns the Ansible-compatible docs dict for this field.
         """
 
-        if isinstance(self.description, str):
-            self.description = [self.description]
-
-        result = {
-            "type": self.type,
-            "required": self.required,
-            "description": self.description,
-        }
+        description = self.description
+        if isinstance(description, str):
+            description = [description]
 
-        if self.default is not None:
-            result["default"] = self.default
-
-        if self.choices is not None:
-            result["choices"] = self.choices
-
-        if self.element_type is not None:
-            result["elements"] = self.element_type
-
-        if self.aliases is not None:
-            result["aliases"] = self.aliases
-
-        if self.version_added is not None:
-            result["version_added"] = self.version_added
+        result = _emit(
+            {
+                "type": self.type,
+                "required": self.required,
+                "description": description,
+            },
+            self,
+            SPEC_FIELD_ANSIBLE_DOC_ATTRS,
+        )
 
         if self.suboptions is not None:
             result["suboptions"] = {
@@ -125,12 +166,17 @@ class SpecField:
     def doc_dict(self) -> Optional[Dict[str, Any]]:
         """
         Returns the docs dict for this field.
+
+        Only the top-level dict is copied; list and dict values are shared
+        with this field and must not be mutated by callers.
         """
 
-        result = copy.deepcopy(self.__dict__)
+        result = {f.name: getattr(self, f.name) for f in fields(self)}
 
-        if isinstance(result["description"], str):
-            result["description"] = [result["description"]]
+        description = result["description"]
+        result["description"] = (
+            [description] if isinstance(description, str) else list(description)
+        )
 
         if self.suboptions is not None:
             result["suboptions"] = {
@@ -146,20 +192,16 @@ class SpecField:
         """
         Returns the Ansible-compatible spec for this field.
         """
-        result = {
-            "type": str(self.type),
-            "no_log": self.no_log,
-            "required": self.required,
-        }
 
-        if self.default is not None:
-            result["default"] = self.default
-
-        if self.choices is not None:
-            result["choices"] = self.choices
-
-        if self.aliases is not None:
-            result["aliases"] = self.aliases
+        result = _emit(
+            {
+                "type": self.type,
+                "no_log": self.no_log,
+                "required": self.required,
+            },
+            self,
+            SPEC_FIELD_ANSIBLE_SPEC_ATTRS,
+        )
 
         if self.suboptions is not None:
             result["options"] = {
@@ -167,7 +209,7 @@ class SpecField:
             }
 
         if self.element_type is not None:
-            result["elements"] = str(self.element_type)
+            result["elements"] = self.element_type
 
         if self.additional_fields is not None:
             result = {**result, **self.additional_fields}
@@ -175,7 +217,7 @@ class SpecField:
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class SpecReturnValue:
     """
     A description of an Ansible module's return value.
@@ -196,7 +238,7 @@ class SpecReturnValue:
         """
         Returns a documentation dict for a return value.
         """
-        result = self.__dict__
+        result = {f.name: getattr(self, f.name) for f in fields(self)}
 
         if self.contains is not None:
             result["contains"] = {
@@ -210,28 +252,26 @@ class SpecReturnValue:
         """
         Returns an Ansible-compatible documentation dict for a return value.
         """
-        result = {
-            "description": self.description,
-            "type": str(self.type),
-            "returned": self.returned,
-            "sample": json.loads("".join(self.sample)),
-        }
-
-        if self.elements is not None:
-            result["elements"] = self.elements
+        result = _emit(
+            {
+                "description": self.description,
+                "type": self.type,
+                "returned": self.returned,
+                "sample": json.loads("".join(self.sample)),
+            },
+            self,
+            SPEC_RETURN_VALUE_ANSIBLE_DOC_ATTRS,
+        )
 
         if self.contains is not None:
             result["contains"] = {
                 k: v.ansible_doc for k, v in self.contains.items()
             }
 
-        if self.version_added is not None:
-            result["version_added"] = self.version_added
-
         return result
 
 
-@dataclass
+@dataclass(slots=True)
 class SpecDocMeta:
     """
     The top-level description of an Ansible module.
@@ -245,6 +285,8 @@ class SpecDocMeta:
     short_description: Optional[str] = None
     requirements: Optional[List[str]] = None
     author: Optional[List[str]] = None
+
+    # YAML example strings, injected into EXAMPLES verbatim
     examples: Optional[List[str]] = field(default_factory=lambda: [])
     return_values: Optional[Dict[str, SpecReturnValue]] = field(
         default_factory=lambda: {}
@@ -259,7 +301,7 @@ class SpecDocMeta:
         This isn't implemented as __dict__ because it is not 1:1 with the class layout.
         """
 
-        result = self.__dict__
+        result = {f.name: getattr(self, f.name) for f in fields(self)}
 
         if isinstance(result["description"], str):
             result["description"] = [result["description"]]
@@ -284,6 +326,18 @@ class SpecDocMeta:
         Returns the Ansible-compatible documentation dicts for this module.
         """
 
+        return self.get_ansible_doc()
+
+    def get_ansible_doc(
+        self, raw_examples: bool = False
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Union[List, str]]:
+        """
+        Returns the Ansible-compatible documentation dicts for this module.
+
+        If raw_examples is True, the examples are returned as a single
+        YAML string rather than being parsed.
+        """
+
         description = (
             self.description
             if isinstance(self.description, str)
@@ -307,8 +361,7 @@ class SpecDocMeta:
             },
         }
 
-        if self.version_added is not None:
-            documentation["version_added"] = self.version_added
+        _emit(documentation, self, SPEC_DOC_META_ANSIBLE_DOC_ATTRS)
 
         if self.deprecated is not None:
             documentation["deprecated"] = self.deprecated.ansible_doc_dict
@@ -317,7 +370,17 @@ class SpecDocMeta:
             k: v.ansible_doc for k, v in self.return_values.items()
         }
 
-        examples = yaml.safe_load("\n".join(self.examples))
+        examples_str = "\n".join(self.examples)
+
+        if raw_examples:
+            return documentation, return_values, examples_str
+
+        # JSON is valid YAML and much cheaper to parse,
+        # so try that before falling back to the YAML parser.
+        try:
+            examples = json.loads(examples_str)
+        except json.JSONDecodeError:
+            examples = yaml.load(examples_str, Loader=SafeLoader)
 
         return documentation, return_values, examples
 
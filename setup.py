@@ -29,7 +29,8 @@ setuptools.setup(
     url="https://github.com/linode/ansible-specdoc/",
     packages=["ansible_specdoc"],
     install_requires=requirements_path.read_text().splitlines(),
-    python_requires=">=3.9",
+    extras_require={"orjson": ["orjson>=3.9.0"]},
+    python_requires=">=3.10",
     entry_points={
         "console_scripts": ["ansible-specdoc=ansible_specdoc.cli:main"],
     },
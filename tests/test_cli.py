@@ -2,188 +2,519 @@
 
 # pylint: disable=protected-access
 
-import json
 import os
-import unittest
+import pathlib
+import re
+from dataclasses import asdict
 from types import SimpleNamespace
-from typing import Any, Dict
+from typing import Any, Dict, List
 
+import jinja2
+import pytest
 import yaml
 
+import ansible_specdoc.cli
 from ansible_specdoc.cli import CLI, SpecDocModule
-from ansible_specdoc.objects import SpecDocMeta, SpecField
+from ansible_specdoc.objects import (
+    DeprecationInfo,
+    FieldType,
+    SpecDocMeta,
+    SpecField,
+)
 from tests.test_modules import module_1
 
-TEST_MODULES_DIR = os.path.join(
-    os.path.dirname(os.path.realpath(__file__)), "test_modules"
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TEST_MODULES_DIR = os.path.join(TESTS_DIR, "test_modules")
+TEST_FILES_DIR = os.path.join(TESTS_DIR, "test_files")
+
+MODULE_1_DIR = os.path.join(TEST_MODULES_DIR, "module_1.py")
+CONFLICTING_DEPRECATION_MODULE_DIR = os.path.join(
+    TEST_MODULES_DIR, "module_conflicting_deprecation.py"
 )
-TEST_FILES_DIR = os.path.join(
-    os.path.dirname(os.path.realpath(__file__)), "test_files"
+
+CLEAR_ARGS = SimpleNamespace(clear_injected_fields=True)
+
+CLEARED_FIELD_PATTERN = re.compile(
+    r'^(DOCUMENTATION|EXAMPLES|RETURN) = r"""\n"""', re.MULTILINE
 )
 
-MODULE_1_DIR = os.path.join(TEST_MODULES_DIR, "module_1.py")
+# Expected values derived from the original spec
+EXPECTED_SPEC = module_1.SPECDOC_META
+EXPECTED_DEPRECATED = EXPECTED_SPEC.deprecated.ansible_doc_dict
+EXPECTED_RETURN_VALUES = {
+    k: asdict(v) for k, v in EXPECTED_SPEC.return_values.items()
+}
 
 
-class TestDocs(unittest.TestCase):
-    """Docs generation tests"""
+def assert_spec_options_valid(
+    yaml_spec: Dict[str, Any], module_spec: Dict[str, SpecField]
+):
+    """Assert that spec options match, including all nested suboptions"""
 
-    @staticmethod
-    def assert_docs_dict_valid(
-        original_spec: SpecDocMeta, generated_spec: Dict[str, Any]
-    ):
-        """Assert that the two specs are matching"""
-
-        assert generated_spec.get("description") == original_spec.description
-        assert generated_spec.get("requirements") == original_spec.requirements
-        assert generated_spec.get("author") == original_spec.author
-        assert generated_spec.get("examples") == original_spec.examples
-        assert (
-            generated_spec.get("deprecated")
-            == original_spec.deprecated.ansible_doc_dict
-        )
-        assert generated_spec.get("return_values") == {
-            k: v.__dict__ for k, v in original_spec.return_values.items()
-        }
-
-        def assert_spec_recursive(
-            yaml_spec: Dict[str, Any], module_spec: Dict[str, SpecField]
-        ):
-            """Recursively assert that spec options match"""
-
-            for key, value in yaml_spec.items():
-                # If item is rendered regardless of doc_hide
-                if module_spec.get(key).doc_hide:
-                    raise Exception("item not hidden for doc_hide value")
-
-                assert value.get("type") == module_spec.get(key).type
-                assert value.get("required") == module_spec.get(key).required
-                assert (
-                    value.get("description") == module_spec.get(key).description
-                )
-
-                options = value.get("suboptions")
-                if options is not None:
-                    assert_spec_recursive(
-                        options, module_spec.get(key).suboptions
-                    )
-
-                editable = value.get("editable")
-                if editable:
-                    assert editable == module_spec.get(key).editable
-
-                conflicts_with = value.get("conflicts_with")
-                if conflicts_with:
-                    assert conflicts_with == module_spec.get(key).conflicts_with
-
-        assert_spec_recursive(
-            generated_spec.get("options"), original_spec.options
-        )
+    stack = [(yaml_spec, module_spec)]
 
-    @staticmethod
-    def test_docs_yaml_module_override():
-        """Test that module names can be overridden"""
-        module = SpecDocModule()
+    while stack:
+        yaml_options, module_options = stack.pop()
 
-        module.load_file(MODULE_1_DIR, "really_cool_mod")
+        for key, value in yaml_options.items():
+            module_field = module_options[key]
+
+            # If item is rendered regardless of doc_hide
+            if module_field.doc_hide:
+                raise Exception("item not hidden for doc_hide value")
+
+            assert (
+                value.get("type"),
+                value.get("required"),
+                value.get("description"),
+                value.get("editable") or None,
+                value.get("conflicts_with") or None,
+            ) == (
+                module_field.type,
+                module_field.required,
+                module_field.description,
+                module_field.editable or None,
+                module_field.conflicts_with or None,
+            )
+
+            options = value.get("suboptions")
+            if options is not None:
+                stack.append((options, module_field.suboptions))
+
+
+def assert_docs_dict_valid(generated_spec: Dict[str, Any]):
+    """Assert that the generated spec matches the original module spec"""
+
+    assert generated_spec.get("description") == EXPECTED_SPEC.description
+    assert generated_spec.get("requirements") == EXPECTED_SPEC.requirements
+    assert generated_spec.get("author") == EXPECTED_SPEC.author
+    assert generated_spec.get("examples") == EXPECTED_SPEC.examples
+    assert generated_spec.get("deprecated") == EXPECTED_DEPRECATED
+    assert generated_spec.get("return_values") == EXPECTED_RETURN_VALUES
+
+    assert_spec_options_valid(
+        generated_spec.get("options"), EXPECTED_SPEC.options
+    )
+
+
+def spec_module(metadata: SpecDocMeta, module_name: str) -> SpecDocModule:
+    """Wraps the given spec in a SpecDocModule without loading any source"""
+    module = SpecDocModule()
+    module._module_name = module_name
+    module._metadata = metadata
+    return module
+
+
+# Tests only read from the loaded modules and files,
+# so they're loaded once per test module.
+@pytest.fixture(scope="module", name="loaded_module")
+def fixture_loaded_module() -> SpecDocModule:
+    """The module_1 test module"""
+    module = SpecDocModule()
+    module.load_file(MODULE_1_DIR)
+    return module
+
+
+@pytest.fixture(scope="module", name="renamed_module")
+def fixture_renamed_module() -> SpecDocModule:
+    """The module_1 test module loaded under a different name"""
+    module = SpecDocModule()
+    module.load_file(MODULE_1_DIR, "really_cool_mod")
+    return module
+
+
+@pytest.fixture(scope="module", name="module_contents")
+def fixture_module_contents() -> str:
+    """The source of the module_1 test module"""
+    return pathlib.Path(MODULE_1_DIR).read_text()
+
+
+@pytest.fixture(scope="module", name="template_str")
+def fixture_template_str() -> str:
+    """The source of the test Jinja2 template"""
+    return pathlib.Path(TEST_FILES_DIR, "template.j2").read_text()
+
+
+@pytest.fixture(scope="module", name="template")
+def fixture_template() -> jinja2.Template:
+    """The test Jinja2 template, compiled"""
+    env = SpecDocModule.jinja2_environment(
+        loader=jinja2.FileSystemLoader(TEST_FILES_DIR)
+    )
+    return env.get_template("template.j2")
 
-        assert (
-            yaml.safe_load(module.generate_yaml()).get("module")
-            == "really_cool_mod"
-        )
 
-    def test_docs_file_yaml(self):
-        """Test that the YAML output is valid"""
-        module = SpecDocModule()
+def test_docs_yaml_module_override(renamed_module):
+    """Test that module names can be overridden"""
+    assert renamed_module.generate_dict().get("module") == "really_cool_mod"
+
+
+@pytest.mark.parametrize(
+    "generate,load",
+    [
+        ("generate_dict", lambda data: data),
+        ("generate_yaml", lambda data: yaml.load(data, Loader=SafeLoader)),
+        ("generate_json", json_loads),
+    ],
+    ids=["dict", "yaml", "json"],
+)
+def test_docs_file_outputs(loaded_module, generate, load):
+    """Test that the dict, YAML and JSON outputs are valid"""
+    output = load(getattr(loaded_module, generate)())
+
+    assert output.get("module") == "module_1"
+
+    assert_docs_dict_valid(output)
+
+
+def test_docs_json_backends_match(loaded_module, monkeypatch):
+    """Test that orjson and the stdlib fallback produce the same JSON"""
+    pytest.importorskip("orjson")
+
+    unicode_module = spec_module(
+        SpecDocMeta(
+            description="Gère les cafés ☕",
+            options={
+                "size": SpecField(
+                    type=FieldType.float, default=0.5, choices=[0.5, 1, 2.25]
+                ),
+            },
+        ),
+        "unicode_module",
+    )
+
+    modules = (loaded_module, unicode_module)
+    orjson_outputs = [module.generate_json() for module in modules]
+
+    monkeypatch.setattr(ansible_specdoc.cli, "orjson", None)
+
+    assert [module.generate_json() for module in modules] == orjson_outputs
+
+
+def test_docs_json_large_int(monkeypatch):
+    """Test that integers orjson can't encode are still written out"""
+    module = spec_module(
+        SpecDocMeta(
+            description="Large int module",
+            options={
+                "size": SpecField(type=FieldType.integer, default=2**64),
+            },
+        ),
+        "large_int_module",
+    )
+
+    output = module.generate_json()
+
+    assert f'"default":{2**64}' in output
+
+    monkeypatch.setattr(ansible_specdoc.cli, "orjson", None)
+
+    assert module.generate_json() == output
+
+
+def test_docs_file_template(loaded_module, template_str):
+    """Test that Jinja2 outputs are valid"""
+    output = loaded_module.generate_jinja2(template_str)
+
+    assert "really cool module name: module_1" in output
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["{'b': 1, 'a': [2]} | tojson", "{'b': 1, 'a': [2]}"],
+    ids=["json-string", "dict"],
+)
+def test_docs_template_format_json(loaded_module, value):
+    """Test that the format_json filter accepts JSON strings and dicts"""
+    output = loaded_module.generate_jinja2(f"{{{{ {value} | format_json }}}}")
+
+    assert output == '{\n    "a": [\n        2\n    ],\n    "b": 1\n}'
+
+
+def test_docs_file_compiled_template(loaded_module, template):
+    """Test that precompiled Jinja2 templates can be rendered"""
+    output = loaded_module.generate_jinja2_from_template(template)
+
+    assert "really cool module name: module_1" in output
+
+
+@pytest.mark.parametrize("output_format", ["yaml", "json"])
+def test_output_file_kept_on_error(tmp_path, output_format):
+    """Test that the output file is left untouched if generation fails"""
+    output_file = tmp_path / "docs.out"
+    output_file.write_text("previous docs")
+
+    cli = CLI(
+        [
+            "-i",
+            CONFLICTING_DEPRECATION_MODULE_DIR,
+            "-o",
+            str(output_file),
+            "-f",
+            output_format,
+        ]
+    )
+
+    with pytest.raises(ValueError, match="conflicting fields"):
+        cli.execute()
+
+    assert output_file.read_text() == "previous docs"
+
+    # The temporary output file is cleaned up
+    assert list(tmp_path.iterdir()) == [output_file]
 
-        module.load_file(MODULE_1_DIR)
 
-        output_yaml = yaml.safe_load(module.generate_yaml())
+def test_output_file_replaced(tmp_path):
+    """Test that the output file is replaced, keeping its permissions"""
+    output_file = tmp_path / "docs.yaml"
+    output_file.write_text("previous docs")
+    output_file.chmod(0o640)
 
-        assert output_yaml.get("module") == "module_1"
+    CLI(["-i", MODULE_1_DIR, "-o", str(output_file), "-f", "yaml"]).execute()
 
-        self.assert_docs_dict_valid(module_1.SPECDOC_META, output_yaml)
+    output = yaml.load(output_file.read_text(), Loader=SafeLoader)
 
-    def test_docs_file_json(self):
-        """Test that the JSON output is valid"""
-        module = SpecDocModule()
+    assert output.get("module") == "module_1"
+    assert output_file.stat().st_mode & 0o777 == 0o640
+    assert list(tmp_path.iterdir()) == [output_file]
 
-        module.load_file(MODULE_1_DIR)
 
-        output_json = json.loads(module.generate_json())
+def test_docs_compiled_template_filters(loaded_module):
+    """Test that templates from the public environment can use the filters"""
+    template = SpecDocModule.jinja2_environment().from_string(
+        "{{ author | format_json }}"
+    )
 
-        assert output_json.get("module") == "module_1"
+    output = loaded_module.generate_jinja2_from_template(template)
 
-        self.assert_docs_dict_valid(module_1.SPECDOC_META, output_json)
+    assert json_loads(output) == EXPECTED_SPEC.author
 
-    def test_docs_file_ansible(self):
-        """Test that the JSON output is valid"""
-        module = SpecDocModule()
 
-        module.load_file(MODULE_1_DIR)
+def test_field_description_not_mutated():
+    """Test that generating docs does not modify a field's description"""
+    spec_field = SpecField(
+        type=FieldType.string, description="A really cool string"
+    )
 
-        output_json = json.loads(module.generate_json())
+    ansible_doc = spec_field.ansible_doc_dict
 
-        assert output_json.get("module") == "module_1"
+    assert ansible_doc.get("description") == ["A really cool string"]
+    assert spec_field.doc_dict.get("description") == ["A really cool string"]
+    assert spec_field.description == "A really cool string"
 
-        self.assert_docs_dict_valid(module_1.SPECDOC_META, output_json)
 
-    @staticmethod
-    def test_docs_file_template():
-        """Test that Jinja2 outputs are valid"""
-        module = SpecDocModule()
+def test_field_docs_reflect_updates():
+    """Test that generated docs are rebuilt after a field is modified"""
+    spec_field = SpecField(type=FieldType.string)
 
-        module.load_file(MODULE_1_DIR)
+    ansible_doc = spec_field.ansible_doc_dict
+    ansible_doc["required"] = True
 
-        with open(os.path.join(TEST_FILES_DIR, "template.j2"), "r") as file:
-            template_str = file.read()
+    assert spec_field.ansible_doc_dict.get("required") is False
 
-        output = module.generate_jinja2(template_str)
+    spec_field.required = True
+    spec_field.choices = ["a", "b"]
 
-        assert "really cool module name: module_1" in output
+    assert spec_field.ansible_doc_dict.get("required") is True
+    assert spec_field.doc_dict.get("choices") == ["a", "b"]
+    assert spec_field.ansible_spec.get("choices") == ["a", "b"]
 
-    @staticmethod
-    def test_docs_file_injection():
-        """Test that documentation fields are injected correctly"""
-        module_path = MODULE_1_DIR
 
-        module = SpecDocModule()
+def test_deprecation_conflict_after_update():
+    """Test that conflicting deprecation fields are caught after an update"""
+    deprecated = DeprecationInfo(alternative="new_module", removed_in="2.0.0")
 
-        module.load_file(module_path)
+    assert deprecated.ansible_doc_dict == {
+        "alternative": "new_module",
+        "removed_in": "2.0.0",
+    }
 
-        docs, returns, examples = module.generate_ansible_doc_yaml()
+    deprecated.removed_by_date = "2030-01-01"
 
-        with open(MODULE_1_DIR, "r") as file:
-            module_contents = file.read()
+    with pytest.raises(ValueError, match="conflicting fields"):
+        _ = deprecated.ansible_doc_dict
 
-        cli = CLI()
-        cli._mod = module
 
-        output = cli._inject_docs(module_contents)
+@pytest.mark.parametrize(
+    "examples",
+    [
+        ['[{"name": "Ping", "ping": {}}, {"name": "Pong", "ping": {}}]'],
+        ["- name: Ping\n  ping: {}", "- name: Pong\n  ping: {}"],
+    ],
+    ids=["json", "yaml"],
+)
+def test_meta_ansible_doc_examples(examples):
+    """Test that both JSON and YAML examples are parsed"""
+    meta = SpecDocMeta(description="Examples", options={}, examples=examples)
+
+    _, _, parsed_examples = meta.ansible_doc
+
+    assert parsed_examples == [
+        {"name": "Ping", "ping": {}},
+        {"name": "Pong", "ping": {}},
+    ]
+
+
+def examples_module(examples: List[str]) -> SpecDocModule:
+    """A minimal module with the given examples"""
+    return spec_module(
+        SpecDocMeta(description="Examples", options={}, examples=examples),
+        "examples_module",
+    )
+
+
+def test_docs_ansible_examples_multiple():
+    """Test that multiple examples are written out as a single YAML block"""
+    module = examples_module(
+        ["- name: First\n  ping: {}", "- name: Second\n  ping: {}"]
+    )
+
+    _, _, examples = module.generate_ansible_doc_yaml()
+
+    assert examples == "- name: First\n  ping: {}\n- name: Second\n  ping: {}\n"
+    assert yaml.load(examples, Loader=SafeLoader) == [
+        {"name": "First", "ping": {}},
+        {"name": "Second", "ping": {}},
+    ]
+
+
+def test_docs_ansible_examples_empty():
+    """Test that an empty examples list produces an empty block"""
+    module = examples_module([])
+
+    _, _, examples = module.generate_ansible_doc_yaml()
+
+    assert examples == ""
+
+
+def test_docs_ansible_examples_invalid():
+    """Test that invalid YAML examples are rejected"""
+    module = examples_module(["- name: [unclosed"])
+
+    with pytest.raises(yaml.YAMLError):
+        module.generate_ansible_doc_yaml()
+
+
+def test_docs_file_injection(loaded_module, module_contents):
+    """Test that documentation fields are injected correctly"""
+    docs, returns, examples = loaded_module.generate_ansible_doc_yaml()
+
+    cli = CLI([])
+    cli._mod = loaded_module
+
+    output = cli._inject_docs(module_contents)
+
+    expected_fields = (
+        ("DOCUMENTATION", docs),
+        ("EXAMPLES", examples),
+        ("RETURN", returns),
+    )
+
+    for name, value in expected_fields:
+        assert f'{name} = r"""\n{value}"""' in output
 
-        assert f'DOCUMENTATION = r"""\n{docs}"""' in output
-        assert f'EXAMPLES = r"""\n{examples}"""' in output
-        assert f'RETURN = r"""\n{returns}"""' in output
-        assert "{" not in returns
+    assert "{" not in returns
 
-    @staticmethod
-    def test_docs_file_clear():
-        """Test that documentation fields are injected correctly"""
-        module_path = MODULE_1_DIR
 
-        module = SpecDocModule()
+INJECTION_MODULE_DOCSTRING = (
+    '"""\nExample module.\n\nDOCUMENTATION = "not a real field"\n"""\n'
+)
+
+
+@pytest.mark.parametrize(
+    "field_value",
+    ["'''\nold\n'''", "'old'", '"""\nold\n"""', "u'old'"],
+    ids=["triple-single", "single", "unprefixed", "u-prefixed"],
+)
+@pytest.mark.parametrize(
+    "separator", ["\n", "; "], ids=["separate-lines", "same-line"]
+)
+def test_docs_injection_field_forms(loaded_module, field_value, separator):
+    """Test that fields are injected regardless of how they're written"""
+    docs, returns, examples = loaded_module.generate_ansible_doc_yaml()
+
+    module_contents = (
+        f"{INJECTION_MODULE_DOCSTRING}\n"
+        + separator.join(
+            f"{name} = {field_value}"
+            for name in ("DOCUMENTATION", "RETURN", "EXAMPLES")
+        )
+        + "\n"
+    )
+
+    cli = CLI([])
+    cli._mod = loaded_module
+
+    output = cli._inject_docs(module_contents)
+
+    expected_fields = (
+        ("DOCUMENTATION", docs),
+        ("EXAMPLES", examples),
+        ("RETURN", returns),
+    )
+
+    for name, value in expected_fields:
+        assert f'{name} = r"""\n{value}"""' in output
+
+    # Assignments inside the module docstring are left as-is
+    assert output.startswith(INJECTION_MODULE_DOCSTRING)
+    assert "old" not in output
 
-        module.load_file(module_path)
 
-        with open(MODULE_1_DIR, "r") as file:
-            module_contents = file.read()
+def test_docs_file_injection_missing_field(loaded_module, module_contents):
+    """Test that injection fails if a documentation field is missing"""
+    module_contents = module_contents.replace("RETURN = ", "RETURNS = ")
 
-        cli = CLI()
-        cli._mod = module
+    cli = CLI([])
+    cli._mod = loaded_module
 
-        cli._args = SimpleNamespace(clear_injected_fields=True)
+    with pytest.raises(
+        Exception, match="an empty RETURN field must be specified"
+    ):
+        cli._inject_docs(module_contents)
+
+
+def test_docs_file_clear(loaded_module, module_contents):
+    """Test that documentation fields are injected correctly"""
+    cli = CLI([])
+    cli._mod = loaded_module
+
+    cli._args = CLEAR_ARGS
+
+    output = cli._inject_docs(module_contents)
+
+    assert set(CLEARED_FIELD_PATTERN.findall(output)) == {
+        "DOCUMENTATION",
+        "EXAMPLES",
+        "RETURN",
+    }
+
+
+def test_ansible_root_cached_per_directory(tmp_path):
+    """Test that files in the same directory share an Ansible root lookup"""
+    collection_dir = tmp_path / "ansible_collections" / "ns" / "coll"
+    collection_dir.mkdir(parents=True)
+
+    find_ansible_root = CLI._CLI__find_ansible_root
+    find_ansible_root.cache_clear()
+
+    for name in ("module_a.py", "module_b.py", "module_c.py"):
+        assert CLI._get_ansible_root(str(collection_dir / name)) == str(
+            tmp_path
+        )
 
-        output = cli._inject_docs(module_contents)
+    assert CLI._get_ansible_root(str(collection_dir)) == str(tmp_path)
 
-        assert 'DOCUMENTATION = r"""\n"""' in output
-        assert 'EXAMPLES = r"""\n"""' in output
-        assert 'RETURN = r"""\n"""' in output
+    cache_info = find_ansible_root.cache_info()
+    assert (cache_info.misses, cache_info.hits) == (1, 3)
@@ -0,0 +1,24 @@
+"""Module for testing docs generation with a conflicting deprecation"""
+
+from ansible_specdoc.objects import DeprecationInfo, SpecDocMeta
+
+DOCUMENTATION = r"""
+really cool non-empty docstring
+"""
+
+RETURN = r"""
+really cool non-empty return string
+"""
+
+EXAMPLES = r"""
+really cool non-empty examples"""
+
+SPECDOC_META = SpecDocMeta(
+    description=["My really deprecated Ansible module!"],
+    deprecated=DeprecationInfo(
+        alternative="use something else",
+        removed_in="2.0.0",
+        removed_by_date="2030-01-01",
+    ),
+    options={},
+)